@@ -0,0 +1,29 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+
+def token_cache_key(key):
+    return f'auth-token:{sha256(key.encode()).hexdigest()}'
+
+
+def forget_tokens(keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, запоминающая соответствие токена пользователю.
+
+    Запись удаляется сигналами при выходе, удалении токена
+    и изменении пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            cache.set(cache_key, cached, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return cached
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from hashlib import md5
+from threading import Lock
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from recipes.models import Tag
+
+
+class ReferenceCache:
+    """Версионированный кэш справочных данных (теги, ингредиенты)."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    @property
+    def state_key(self):
+        return f'{self.prefix}:state'
+
+    @property
+    def versions(self):
+        return caches['versions']
+
+    def bump(self):
+        state = {'version': uuid4().hex, 'modified': int(time())}
+        self.versions.set(self.state_key, state, None)
+        return state
+
+    def get_state(self):
+        return self.versions.get(self.state_key) or self.bump()
+
+    def key(self, state, path):
+        digest = md5(path.encode()).hexdigest()
+        return f'{self.prefix}:{state["version"]}:{digest}'
+
+    def get(self, state, path):
+        return cache.get(self.key(state, path))
+
+    def set(self, state, path, data):
+        cache.set(
+            self.key(state, path), data, settings.REFERENCE_CACHE_TIMEOUT
+        )
+
+
+class VersionedIndex:
+    """Индекс в памяти процесса, согласованный между процессами версией.
+
+    Смена версии (bump) означает полную пересборку. Точечные изменения
+    пишутся в журнал под возрастающими номерами, и остальные процессы
+    перечитывают из базы только изменённые рецепты. Если записи журнала
+    уже нет в кэше, индекс пересобирается целиком. Журнал и версия лежат
+    в кэше 'versions': процессы видят изменения друг друга, только если
+    он общий (Redis); с LocMemCache у каждого процесса свой журнал.
+    """
+
+    cache = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._position = 0
+
+    def build(self):
+        raise NotImplementedError
+
+    def reload(self, recipe_ids):
+        """Перечитывает из базы данные перечисленных рецептов."""
+        raise NotImplementedError
+
+    def _journal_key(self, version, position=None):
+        key = f'{self.cache.prefix}:{version}:journal'
+        return key if position is None else f'{key}:{position}'
+
+    def _get_position(self, version):
+        return self.cache.versions.get(self._journal_key(version), 0)
+
+    def _get_changes(self, version, start, end):
+        keys = [
+            self._journal_key(version, position)
+            for position in range(start + 1, end + 1)
+        ]
+        entries = self.cache.versions.get_many(keys)
+        if len(entries) != len(keys):
+            return None
+        return {pk for recipe_ids in entries.values() for pk in recipe_ids}
+
+    def _log(self, version, recipe_ids):
+        versions = self.cache.versions
+        versions.add(self._journal_key(version), 0, None)
+        position = versions.incr(self._journal_key(version))
+        versions.set(
+            self._journal_key(version, position), list(recipe_ids),
+            settings.REFERENCE_CACHE_TIMEOUT
+        )
+        return position
+
+    def _sync(self):
+        version = self.cache.get_state()['version']
+        position = self._get_position(version)
+        if self._version == version:
+            if self._position >= position:
+                return
+            changes = self._get_changes(version, self._position, position)
+            if changes is not None:
+                self.reload(changes)
+                self._position = position
+                return
+        self.build()
+        self._version, self._position = version, position
+
+    @contextmanager
+    def reading(self):
+        with self._lock:
+            self._sync()
+            yield
+
+    @contextmanager
+    def updating(self, *recipe_ids):
+        with self.reading():
+            yield
+            position = self._log(self._version, recipe_ids)
+            if position == self._position + 1:
+                self._position = position
+
+
+tag_cache = ReferenceCache('tags')
+ingredient_cache = ReferenceCache('ingredients')
+
+
+def get_tags():
+    """Все теги из кэша справочников, без запроса при тёплом кэше."""
+    state = tag_cache.get_state()
+    tags = tag_cache.get(state, 'tag-list')
+    if tags is None:
+        tags = list(Tag.objects.values('id', 'name', 'color', 'slug'))
+        tag_cache.set(state, 'tag-list', tags)
+    return tags
+
+
+def tag_choices():
+    return [(tag['slug'], tag['name']) for tag in get_tags()]
@@ -0,0 +1,174 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models import F
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+
+from .images import absolute_variant_urls, image_storage, variant_urls
+from .membership import get_membership
+
+
+def build_documents(ids):
+    """Рецепты без пользовательских флагов в виде словарей из .values()."""
+    documents = {}
+    recipes = Recipe.objects.filter(id__in=ids).values(
+        'id', 'name', 'image', 'image_variants', 'text', 'cooking_time',
+        'author_id',
+        email=F('author__email'),
+        username=F('author__username'),
+        first_name=F('author__first_name'),
+        last_name=F('author__last_name'),
+    )
+    for recipe in recipes:
+        documents[recipe['id']] = {
+            'id': recipe['id'],
+            'tags': [],
+            'author': {
+                'email': recipe['email'],
+                'id': recipe['author_id'],
+                'username': recipe['username'],
+                'first_name': recipe['first_name'],
+                'last_name': recipe['last_name'],
+                'is_subscribed': False,
+            },
+            'ingredients': [],
+            'name': recipe['name'],
+            'image': (image_storage.url(recipe['image'])
+                      if recipe['image'] else None),
+            'images': variant_urls(recipe['image_variants']),
+            'text': recipe['text'],
+            'cooking_time': recipe['cooking_time'],
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+        }
+    tags = RecipeTag.objects.filter(recipe_id__in=ids).order_by(
+        '-tag_id'
+    ).values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+    )
+    for recipe_id, tag_id, name, color, slug in tags:
+        documents[recipe_id]['tags'].append(
+            {'id': tag_id, 'name': name, 'color': color, 'slug': slug}
+        )
+    ingredients = RecipeIngredient.objects.filter(
+        recipe_id__in=ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    )
+    for recipe_id, ingredient_id, name, unit, amount in ingredients:
+        documents[recipe_id]['ingredients'].append({
+            'id': str(ingredient_id),
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+    return documents
+
+
+def version_key(pk):
+    return f'recipe:{pk}:version'
+
+
+def snapshot_key(pk, version):
+    return f'recipe:{pk}:{version}:snapshot'
+
+
+def get_versions(ids):
+    """Версии снимков; отсутствующие создаются через add, без перезаписи."""
+    versions = caches['versions']
+    keys = {version_key(pk): pk for pk in ids}
+    found = {
+        keys[key]: version
+        for key, version in versions.get_many(keys).items()
+    }
+    for pk in ids:
+        if pk not in found:
+            version = uuid4().hex
+            if not versions.add(version_key(pk), version, None):
+                version = versions.get(version_key(pk), version)
+            found[pk] = version
+    return found
+
+
+def bump_versions(ids):
+    found = {pk: uuid4().hex for pk in ids}
+    caches['versions'].set_many(
+        {version_key(pk): version for pk, version in found.items()}, None
+    )
+    return found
+
+
+def get_documents(ids):
+    """Снимки рецептов из кэша, недостающие собираются из базы.
+
+    Снимок пишется под версией, прочитанной до запроса к базе: если запись
+    рецепта успела сменить версию, запоздавший снимок никто не прочитает.
+    """
+    versions = get_versions(ids)
+    keys = {snapshot_key(pk, versions[pk]): pk for pk in ids}
+    documents = {
+        keys[key]: document
+        for key, document in cache.get_many(keys).items()
+    }
+    missing = [pk for pk in ids if pk not in documents]
+    if missing:
+        built = build_documents(missing)
+        cache.set_many(
+            {
+                snapshot_key(pk, versions[pk]): document
+                for pk, document in built.items()
+            },
+            settings.RECIPE_SNAPSHOT_TIMEOUT
+        )
+        documents.update(built)
+    return documents
+
+
+def refresh_snapshots(ids):
+    ids = list(ids)
+
+    def refresh():
+        versions = bump_versions(ids)
+        cache.set_many(
+            {
+                snapshot_key(pk, versions[pk]): document
+                for pk, document in build_documents(ids).items()
+            },
+            settings.RECIPE_SNAPSHOT_TIMEOUT
+        )
+
+    transaction.on_commit(refresh)
+
+
+def invalidate_snapshots(ids):
+    ids = list(ids)
+    transaction.on_commit(lambda: bump_versions(ids))
+
+
+def personalize(document, request, membership):
+    image = document['image']
+    return {
+        **document,
+        'author': {
+            **document['author'],
+            'is_subscribed': (document['author']['id']
+                              in membership.following),
+        },
+        'image': image and request.build_absolute_uri(image),
+        'images': absolute_variant_urls(document['images'], request),
+        'is_favorited': document['id'] in membership.favorites,
+        'is_in_shopping_cart': document['id'] in membership.cart,
+    }
+
+
+def serialize_recipes(ids, request):
+    """Тот же вывод, что у RecipeSerializer, без полей ModelSerializer."""
+    documents = get_documents(ids)
+    membership = get_membership(request)
+    return [
+        personalize(documents[pk], request, membership)
+        for pk in ids if pk in documents
+    ]
@@ -0,0 +1,29 @@
+from heapq import merge
+from itertools import islice
+
+from recipes.models import Recipe
+
+FEED_CHUNK_SIZE = 500
+
+
+def feed_ids(author_ids, limit, position=None, reverse=False):
+    """Последние рецепты авторов: id в порядке ленты, не больше limit.
+
+    Авторы делятся на части по FEED_CHUNK_SIZE, каждая часть — один
+    запрос по индексу (author_id, -id) с LIMIT, готовые списки
+    сливаются. Так число строк ограничено числом частей × limit
+    при любом количестве подписок.
+    """
+    authors = sorted(author_ids)
+    ordering, lookup = ('id', 'id__gt') if reverse else ('-id', 'id__lt')
+    streams = []
+    for start in range(0, len(authors), FEED_CHUNK_SIZE):
+        recipes = Recipe.objects.filter(
+            author_id__in=authors[start:start + FEED_CHUNK_SIZE]
+        )
+        if position is not None:
+            recipes = recipes.filter(**{lookup: position})
+        streams.append(
+            recipes.order_by(ordering).values_list('id', flat=True)[:limit]
+        )
+    return list(islice(merge(*streams, reverse=not reverse), limit))
@@ -1,10 +1,13 @@
 from django.contrib.auth import get_user_model
-from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q
 from django_filters.rest_framework import FilterSet, filters
-from django_filters.rest_framework.filters import (AllValuesMultipleFilter,
-                                                   BooleanFilter,
-                                                   ModelChoiceFilter)
-from recipes.models import Ingredient, Recipe
+from django_filters.rest_framework.filters import (BooleanFilter, ChoiceFilter,
+                                                   ModelChoiceFilter,
+                                                   MultipleChoiceFilter)
+from recipes.models import Ingredient, Recipe, RecipeTag
+
+from .cache import get_tags, tag_choices
+from .search import recipe_search
 
 User = get_user_model()
 
@@ -30,9 +33,14 @@ class IngredientFilter(FilterSet):
 
 class RecipeFilter(FilterSet):
     author = ModelChoiceFilter(queryset=User.objects.all())
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleChoiceFilter(field_name='tags__slug', choices=tag_choices)
     is_favorited = BooleanFilter(method='is_favorited_filter')
     is_in_shopping_cart = BooleanFilter(method='is_in_shopping_cart_filter')
+    search = filters.CharFilter(method='search_filter')
+    ordering = ChoiceFilter(
+        choices=(('popular', 'popular'),),
+        method='ordering_filter'
+    )
 
     def is_favorited_filter(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
@@ -44,6 +52,34 @@ class RecipeFilter(FilterSet):
             return queryset.filter(baskets__user=self.request.user)
         return queryset
 
+    def search_filter(self, queryset, name, value):
+        return recipe_search.filter(queryset, value)
+
+    def ordering_filter(self, queryset, name, value):
+        return queryset.order_by('-favorites_count', '-id')
+
+    def tag_facets(self):
+        """Число рецептов по тегам при текущих фильтрах, кроме самих тегов."""
+        data = self.data.copy()
+        data.pop('tags', None)
+        recipes = type(self)(
+            data, queryset=Recipe.objects.all(), request=self.request
+        ).qs.order_by().values('id')
+        counts = dict(RecipeTag.objects.filter(
+            recipe__in=recipes
+        ).values('tag_id').annotate(
+            count=Count('id')
+        ).order_by().values_list('tag_id', 'count'))
+        return [
+            {
+                'id': tag['id'],
+                'name': tag['name'],
+                'slug': tag['slug'],
+                'count': counts.get(tag['id'], 0),
+            }
+            for tag in get_tags()
+        ]
+
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
@@ -0,0 +1,189 @@
+import logging
+import re
+from binascii import Error as BinasciiError
+from binascii import a2b_base64
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+from rest_framework.serializers import ValidationError
+
+logger = logging.getLogger(__name__)
+
+image_storage = Recipe._meta.get_field('image').storage
+
+VARIANTS_DIR = 'recipes/images/variants'
+IMAGE_VARIANTS = {
+    'thumbnail': (480, 480),
+    'detail': (1280, 1280),
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DECODE_CHUNK = 64 * 1024
+NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+
+def decode_base64_image(data, name):
+    """Декодирует base64 по частям во временный файл на диске.
+
+    Размер проверяется по длине строки до декодирования. Переносы строк
+    и прочие символы вне алфавита отбрасываются, а неполная четвёрка в
+    конце части переносится в следующую.
+    """
+    if len(data) * 3 // 4 > settings.MAX_IMAGE_SIZE:
+        raise ValidationError(
+            f'Размер картинки больше {settings.MAX_IMAGE_SIZE} байт'
+        )
+    file = TemporaryUploadedFile(name, None, 0, None)
+    try:
+        tail = ''
+        for start in range(0, len(data), DECODE_CHUNK):
+            chunk = tail + NOT_BASE64.sub('', data[start:start + DECODE_CHUNK])
+            end = len(chunk) - len(chunk) % 4
+            file.write(a2b_base64(chunk[:end]))
+            tail = chunk[end:]
+        file.write(a2b_base64(tail))
+    except BinasciiError:
+        file.close()
+        raise ValidationError('Картинка должна быть в base64')
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+def check_dimensions(image):
+    width, height = image.size
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise ValidationError(
+            f'Картинка больше {settings.MAX_IMAGE_PIXELS} пикселей'
+        )
+
+
+def render_variants(content):
+    """Уменьшенные копии картинки; выполняется в процессе пула."""
+    rendered = {}
+    with Image.open(BytesIO(content)) as image:
+        image.draft('RGB', max(IMAGE_VARIANTS.values()))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        for variant, size in IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            for extension, (image_format, options) in IMAGE_FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **options)
+                rendered.setdefault(variant, {})[extension] = (
+                    buffer.getvalue()
+                )
+    return rendered
+
+
+def variant_urls(variants):
+    return {
+        variant: {
+            extension: image_storage.url(name)
+            for extension, name in formats.items()
+        }
+        for variant, formats in variants.items()
+    }
+
+
+def absolute_variant_urls(urls, request):
+    return {
+        variant: {
+            extension: request.build_absolute_uri(url)
+            for extension, url in formats.items()
+        }
+        for variant, formats in urls.items()
+    }
+
+
+class ImagePipeline:
+    """Генерация вариантов картинок рецептов в пуле процессов.
+
+    При IMAGE_WORKERS = 0 варианты строятся сразу в текущем потоке.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS
+                )
+            return self._executor
+
+    def schedule(self, recipe):
+        transaction.on_commit(
+            partial(self.submit, recipe.id, recipe.image.name)
+        )
+
+    def submit(self, recipe_id, name):
+        variants = Recipe.objects.filter(image=name).exclude(
+            image_variants={}
+        ).values_list('image_variants', flat=True).first()
+        if variants:
+            self.attach(recipe_id, name, variants)
+            return
+        with image_storage.open(name) as file:
+            content = file.read()
+        if not settings.IMAGE_WORKERS:
+            self.store(recipe_id, name, partial(render_variants, content))
+            return
+        future = self.executor.submit(render_variants, content)
+        future.add_done_callback(partial(self.finish, recipe_id, name))
+
+    def finish(self, recipe_id, name, future):
+        """Колбэк пула: выполняется в служебном потоке executor."""
+        close_old_connections()
+        try:
+            self.store(recipe_id, name, future.result)
+        finally:
+            close_old_connections()
+
+    def store(self, recipe_id, name, render):
+        try:
+            self.save(recipe_id, name, render())
+        except Exception:
+            logger.exception('Не удалось сохранить варианты %s', name)
+
+    def save(self, recipe_id, name, rendered):
+        self.attach(recipe_id, name, {
+            variant: {
+                extension: image_storage.save(
+                    f'{VARIANTS_DIR}/{variant}.{extension}',
+                    ContentFile(content)
+                )
+                for extension, content in formats.items()
+            }
+            for variant, formats in rendered.items()
+        })
+
+    @staticmethod
+    def attach(recipe_id, name, variants):
+        recipe = Recipe.objects.filter(id=recipe_id, image=name).first()
+        if recipe is not None:
+            recipe.image_variants = variants
+            recipe.save(update_fields=('image_variants',))
+
+
+image_pipeline = ImagePipeline()
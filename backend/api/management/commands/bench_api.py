@@ -0,0 +1,131 @@
+import json
+from random import Random
+from statistics import mean
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from recipes.models import Ingredient, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон основных эндпоинтов API через тестовый '
+            'клиент: перцентили задержки и число SQL-запросов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--email', help='Пользователь для запросов; '
+                            'по умолчанию — с наибольшим числом подписок')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--baseline',
+                            help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def get_user(self, email):
+        if email:
+            return User.objects.get(email=email)
+        user = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей: '
+                               'сначала выполните generate_data')
+        return user
+
+    def get_endpoints(self, user, random):
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:3])
+        names = list(Ingredient.objects.values_list('name', flat=True)[:200])
+        prefixes = [name[:3] for name in names] or ['сыр']
+        return {
+            'recipes': lambda: '/api/recipes/',
+            'recipes_tags': lambda: '/api/recipes/?' + '&'.join(
+                f'tags={slug}' for slug in slugs
+            ),
+            'recipes_author': lambda: f'/api/recipes/?author={user.id}',
+            'recipes_favorited': lambda: '/api/recipes/?is_favorited=1',
+            'recipes_in_cart': lambda: '/api/recipes/?is_in_shopping_cart=1',
+            'recipes_deep_page': lambda: '/api/recipes/?page=50',
+            'subscriptions': lambda: (
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'ingredients': lambda: (
+                f'/api/ingredients/?name={random.choice(prefixes)}'
+            ),
+            'download_shopping_cart': lambda: (
+                '/api/recipes/download_shopping_cart/'
+            ),
+        }
+
+    def run_endpoint(self, client, url, requests, headers):
+        timings, queries, statuses = [], [], set()
+        for _ in range(requests):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = perf_counter()
+                response = client.get(url(), **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((perf_counter() - started) * 1000)
+            queries.append(counter.count)
+            statuses.add(response.status_code)
+        return {
+            'p50': percentile(timings, 0.5),
+            'p90': percentile(timings, 0.9),
+            'p99': percentile(timings, 0.99),
+            'max': max(timings),
+            'queries': mean(queries),
+            'statuses': sorted(statuses),
+        }
+
+    def handle(self, requests, email, output, baseline, seed, **kwargs):
+        random = Random(seed)
+        user = self.get_user(email)
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        client = Client()
+        previous = {}
+        if baseline:
+            with open(baseline, encoding='utf-8') as file:
+                previous = json.load(file)['endpoints']
+        results = {}
+        self.stdout.write(
+            f'{"эндпоинт":<24}{"p50":>9}{"p90":>9}{"p99":>9}'
+            f'{"запросов":>10}{"Δp50":>9}'
+        )
+        for name, url in self.get_endpoints(user, random).items():
+            client.get(url(), **headers)
+            result = self.run_endpoint(client, url, requests, headers)
+            results[name] = result
+            delta = ''
+            if name in previous:
+                delta = f'{result["p50"] - previous[name]["p50"]:+.2f}'
+            self.stdout.write(
+                f'{name:<24}{result["p50"]:>9.2f}{result["p90"]:>9.2f}'
+                f'{result["p99"]:>9.2f}{result["queries"]:>10.1f}'
+                f'{delta:>9}'
+            )
+        if output:
+            with open(output, 'w', encoding='utf-8') as file:
+                json.dump({
+                    'requests': requests,
+                    'user': user.id,
+                    'endpoints': results,
+                }, file, ensure_ascii=False, indent=2)
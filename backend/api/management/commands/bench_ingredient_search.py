@@ -0,0 +1,67 @@
+from time import perf_counter
+
+from api.filters import IngredientFilter
+from api.search import ingredient_index
+from django.core.management.base import BaseCommand
+from recipes.models import Ingredient
+
+QUERIES = ('с', 'мо', 'сыр', 'карт', 'яйц', 'соус', 'ово', 'перец черн')
+TYPOS = ('картофль', 'моцарела', 'пармизан', 'шампиньёны', 'перец чёрнй')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов через ORM и через индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=QUERIES)
+        parser.add_argument('--typos', nargs='*', default=TYPOS)
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def measure(self, search, value, repeat):
+        started = perf_counter()
+        for _ in range(repeat):
+            result = search(value)
+        return (perf_counter() - started) / repeat * 1000, result
+
+    def orm_search(self, value):
+        queryset = IngredientFilter().filter_name(
+            Ingredient.objects.all(), 'name', value
+        )
+        return list(queryset)
+
+    def handle(self, queries, typos, repeat, **kwargs):
+        ingredient_index.invalidate()
+        started = perf_counter()
+        ingredient_index.search('')
+        self.stdout.write(
+            f'Индекс построен за {(perf_counter() - started) * 1000:.1f} мс'
+        )
+        self.stdout.write(
+            f'{"запрос":<14}{"найдено":>9}{"ORM, мс":>10}{"индекс, мс":>12}'
+        )
+        for value in queries:
+            orm_time, orm_result = self.measure(
+                self.orm_search, value, repeat
+            )
+            index_time, index_result = self.measure(
+                ingredient_index.search, value, repeat
+            )
+            if ({item.id for item in orm_result}
+                    != {item.id for item in index_result}):
+                self.stderr.write(f'Результаты для «{value}» различаются')
+            self.stdout.write(
+                f'{value:<14}{len(index_result):>9}'
+                f'{orm_time:>10.3f}{index_time:>12.3f}'
+            )
+        self.stdout.write(
+            f'{"с опечаткой":<14}{"найдено":>9}{"мс":>10}  лучшее'
+        )
+        for value in typos:
+            fuzzy_time, fuzzy_result = self.measure(
+                ingredient_index.fuzzy, value, repeat
+            )
+            best = fuzzy_result[0][0].name if fuzzy_result else '—'
+            self.stdout.write(
+                f'{value:<14}{len(fuzzy_result):>9}{fuzzy_time:>10.3f}'
+                f'  {best}'
+            )
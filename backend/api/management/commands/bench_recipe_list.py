@@ -0,0 +1,40 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число запросов в секунду к /api/recipes/ '
+            'через RecipeSerializer и через быстрый путь')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--email', help='Запросы от имени пользователя')
+
+    def handle(self, requests, limit, email, **kwargs):
+        headers = {}
+        if email:
+            token, _ = Token.objects.get_or_create(
+                user=User.objects.get(email=email)
+            )
+            headers['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+        url = f'/api/recipes/?limit={limit}'
+        bodies = {}
+        for fast in (False, True):
+            with override_settings(FAST_RECIPE_READS=fast):
+                client = Client()
+                bodies[fast] = client.get(url, **headers).content
+                started = perf_counter()
+                for _ in range(requests):
+                    client.get(url, **headers)
+                elapsed = perf_counter() - started
+            self.stdout.write(
+                f'{"быстрый путь" if fast else "RecipeSerializer":<18}'
+                f'{requests / elapsed:>10.1f} запросов/с'
+            )
+        if bodies[False] != bodies[True]:
+            self.stderr.write('Ответы различаются')
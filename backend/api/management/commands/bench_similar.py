@@ -0,0 +1,51 @@
+from random import Random
+from time import perf_counter
+
+from api.similarity import RecipeMatrix, features
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Замеряет память и задержку поиска похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--ingredients', type=int, default=2200)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, **options):
+        random = Random(options['seed'])
+        ingredients = range(1, options['ingredients'] + 1)
+        weights = [1 / rank for rank in ingredients]
+        matrix = RecipeMatrix(
+            (recipe_id, features(
+                random.choices(
+                    ingredients, weights, k=options['per_recipe']
+                ),
+                random.sample(range(1, options['tags'] + 1), 2)
+            ))
+            for recipe_id in range(1, options['recipes'] + 1)
+        )
+        started = perf_counter()
+        matrix.compile()
+        self.stdout.write(
+            f'Матрица {options["recipes"]} рецептов: '
+            f'{matrix.nbytes / 2 ** 20:.1f} МиБ, '
+            f'сборка {(perf_counter() - started) * 1000:.0f} мс'
+        )
+        timings = []
+        for _ in range(options['queries']):
+            recipe_id = random.randint(1, options['recipes'])
+            started = perf_counter()
+            matrix.similar(recipe_id, options['limit'])
+            timings.append((perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'Запрос: p50 {timings[len(timings) // 2]:.2f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95)]:.2f} мс, '
+            f'max {timings[-1]:.2f} мс'
+        )
@@ -0,0 +1,66 @@
+from collections import namedtuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from recipes.models import Favorites, ShoppingCart
+from users.models import Subscriptions, User
+
+Membership = namedtuple('Membership', ('favorites', 'cart', 'following'))
+
+EMPTY_MEMBERSHIP = Membership(frozenset(), frozenset(), frozenset())
+
+
+def version_key(user_id):
+    return f'membership:{user_id}:version'
+
+
+def bump_membership(user):
+    cache.set(version_key(user.id), uuid4().hex, None)
+
+
+def lock_membership(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Изменения избранного и корзины одного пользователя выполняются по
+    очереди, и счётчики рецептов считаются по закоммиченному состоянию.
+    """
+    list(User.objects.select_for_update().filter(
+        id=user.id
+    ).values_list('id', flat=True))
+
+
+def load_membership(user):
+    return Membership(
+        frozenset(Favorites.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True)),
+        frozenset(ShoppingCart.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True)),
+        frozenset(Subscriptions.objects.filter(
+            user=user
+        ).values_list('author_id', flat=True)),
+    )
+
+
+def get_membership(request):
+    """Избранное, корзина и подписки пользователя — один раз на запрос."""
+    membership = getattr(request, '_membership', None)
+    if membership is not None:
+        return membership
+    user = request.user
+    if user.is_anonymous:
+        membership = EMPTY_MEMBERSHIP
+    else:
+        version = cache.get(version_key(user.id))
+        if version is None:
+            version = uuid4().hex
+            cache.set(version_key(user.id), version, None)
+        key = f'membership:{user.id}:{version}'
+        membership = cache.get(key)
+        if membership is None:
+            membership = load_membership(user)
+            cache.set(key, membership, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    request._membership = membership
+    return membership
@@ -0,0 +1,166 @@
+"""Счётчики SQL и времени обработки запросов с гистограммами в памяти."""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.db import connection
+
+TIME_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+METRICS = {
+    'total_ms': ('Полное время запроса', TIME_BUCKETS),
+    'sql_ms': ('Время SQL-запросов', TIME_BUCKETS),
+    'sql_count': ('Число SQL-запросов', COUNT_BUCKETS),
+    'app_ms': ('Время во view без учёта SQL', TIME_BUCKETS),
+    'serialize_ms': ('Время рендеринга ответа', TIME_BUCKETS),
+}
+
+current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            running += count
+            yield bound, running
+
+
+class Registry:
+    """Гистограммы по метрикам и view в пределах процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}
+
+    def observe(self, view, values):
+        with self.lock:
+            for metric, value in values.items():
+                histogram = self.histograms.get((metric, view))
+                if histogram is None:
+                    histogram = self.histograms[metric, view] = Histogram(
+                        METRICS[metric][1]
+                    )
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def exposition(self):
+        """Текстовый формат Prometheus."""
+        lines = []
+        with self.lock:
+            items = sorted(self.histograms.items())
+            for metric, (description, _) in METRICS.items():
+                name = f'foodgram_request_{metric}'
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (key, view), histogram in items:
+                    if key != metric:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append(
+                            f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                            f'{count}'
+                        )
+                    lines.append(
+                        f'{name}_sum{{view="{view}"}} {histogram.sum:.3f}'
+                    )
+                    lines.append(
+                        f'{name}_count{{view="{view}"}} {histogram.total}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    def __init__(self, view=''):
+        self.view = view
+        self.started = perf_counter()
+        self.finished = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.view_time = 0.0
+        self.view_sql_time = 0.0
+        self.serialize_time = 0.0
+        self._view_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += perf_counter() - started
+
+    def start_view(self, view):
+        self.view = view
+        self._view_started = (perf_counter(), self.sql_time)
+
+    def finish_view(self):
+        if self._view_started is None:
+            return
+        started, sql_time = self._view_started
+        self.view_time = perf_counter() - started
+        self.view_sql_time = self.sql_time - sql_time
+        self._view_started = None
+
+    @property
+    def total_time(self):
+        return (self.finished or perf_counter()) - self.started
+
+    def values(self):
+        return {
+            'total_ms': self.total_time * 1000,
+            'sql_ms': self.sql_time * 1000,
+            'sql_count': self.sql_count,
+            'app_ms': (self.view_time - self.view_sql_time) * 1000,
+            'serialize_ms': self.serialize_time * 1000,
+        }
+
+    def server_timing(self):
+        values = self.values()
+        return ', '.join((
+            f'sql;dur={values["sql_ms"]:.2f};'
+            f'desc="{self.sql_count} queries"',
+            f'app;dur={values["app_ms"]:.2f}',
+            f'serialize;dur={values["serialize_ms"]:.2f}',
+            f'total;dur={values["total_ms"]:.2f}',
+        ))
+
+
+@contextmanager
+def instrument(view=''):
+    """Считает SQL-запросы и время внутри блока.
+
+    Используется middleware, но подходит и для тестов:
+
+        with instrument() as metrics:
+            client.get('/api/recipes/')
+        assert metrics.sql_count <= 6
+    """
+    metrics = RequestMetrics(view)
+    token = current.set(metrics)
+    try:
+        with connection.execute_wrapper(metrics):
+            yield metrics
+    finally:
+        metrics.finished = perf_counter()
+        current.reset(token)
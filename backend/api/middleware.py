@@ -0,0 +1,50 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import current, instrument, registry
+
+
+def view_name(request, view_func):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class RequestMetricsMiddleware:
+    """SQL и время по каждому запросу: заголовок Server-Timing и гистограммы.
+
+    Включается настройкой REQUEST_METRICS; иначе Django исключает
+    middleware из цепочки целиком.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with instrument() as metrics:
+            response = self.get_response(request)
+            metrics.finish_view()
+        response['Server-Timing'] = metrics.server_timing()
+        registry.observe(metrics.view or 'unresolved', metrics.values())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current.get().start_view(view_name(request, view_func))
+
+    def process_template_response(self, request, response):
+        metrics = current.get()
+        metrics.finish_view()
+        started = perf_counter()
+
+        def rendered(response):
+            metrics.serialize_time += perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,47 @@
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class ReferenceCacheMixin:
+    reference_cache = None
+    uncached_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """Ответ из кэша справочников с ETag и Last-Modified.
+
+        304 отдаётся только для существующего ресурса, то есть после
+        попадания в кэш или успешного ответа обработчика. Запросы с
+        параметрами из uncached_params не кэшируются.
+        """
+        state = self.reference_cache.get_state()
+        cacheable = not any(
+            param in request.query_params for param in self.uncached_params
+        )
+        path = request.get_full_path()
+        data = self.reference_cache.get(state, path) if cacheable else None
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            if cacheable:
+                self.reference_cache.set(state, path, data)
+        etag = f'"{state["version"]}"'
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=state['modified']
+        )
+        if not_modified is not None:
+            return not_modified
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(state['modified'])
+        return response
@@ -1,6 +1,110 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def reverse_ordering(ordering):
+    return tuple(
+        field[1:] if field.startswith('-') else '-' + field
+        for field in ordering
+    )
+
+
+class LimitCursorPagination(CursorPagination):
+    """Курсор по всем полям сортировки, а не только по первому.
+
+    Позиция — JSON-список значений полей. Последним полем всегда идёт
+    id, поэтому позиции уникальны и при равных значениях первого поля
+    (например, favorites_count) смещение не нужно.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = 6
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.query.order_by
+                         or queryset.model._meta.ordering)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id',)
+        return ordering
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [field.lstrip('-') for field in ordering]
+        if isinstance(instance, dict):
+            return json.dumps([instance[field] for field in fields])
+        return json.dumps([getattr(instance, field) for field in fields])
+
+    def parse_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def keyset_filter(self, position, reverse):
+        condition, equal = Q(), Q()
+        for field, value in zip(self.ordering,
+                                self.parse_position(position)):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, position = self.cursor or (0, False, None)
+        queryset = queryset.order_by(
+            *(reverse_ordering(self.ordering) if reverse else self.ordering)
+        )
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = None
+        if len(results) > self.page_size:
+            following = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        started = position is not None or offset > 0
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = started, following is not None
+            self.next_position, self.previous_position = position, following
+        else:
+            self.has_next, self.has_previous = following is not None, started
+            self.next_position, self.previous_position = following, position
+        return self.page
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (self.cursor_query_param in request.query_params
+                and isinstance(queryset, QuerySet)):
+            self.cursor_paginator = LimitCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,84 @@
+from array import array
+from collections import Counter, defaultdict
+
+from recipes.models import RecipeIngredient
+
+from .cache import ReferenceCache, VersionedIndex
+
+
+class PantryIndex(VersionedIndex):
+    """Обратный индекс «ингредиент → рецепты» для подбора по продуктам."""
+
+    cache = ReferenceCache('pantry')
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+        self._recipes = {}
+
+    def build(self):
+        postings = defaultdict(lambda: array('Q'))
+        recipes = defaultdict(list)
+        rows = RecipeIngredient.objects.order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator()
+        for recipe_id, ingredient_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self._postings = dict(postings)
+        self._recipes = {
+            recipe_id: frozenset(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            posting = self._postings[ingredient_id]
+            posting.remove(recipe_id)
+            if not posting:
+                del self._postings[ingredient_id]
+
+    def _add(self, recipe_id, ingredient_ids):
+        self._recipes[recipe_id] = frozenset(ingredient_ids)
+        for ingredient_id in self._recipes[recipe_id]:
+            self._postings.setdefault(
+                ingredient_id, array('Q')
+            ).append(recipe_id)
+
+    def reload(self, recipe_ids):
+        rows = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            rows[recipe_id].append(ingredient_id)
+        for recipe_id in recipe_ids:
+            self._remove(recipe_id)
+            if recipe_id in rows:
+                self._add(recipe_id, rows[recipe_id])
+
+    def update_recipe(self, recipe_id, ingredient_ids, tag_ids=()):
+        with self.updating(recipe_id):
+            self._remove(recipe_id)
+            self._add(recipe_id, ingredient_ids)
+
+    def remove_recipe(self, recipe_id):
+        with self.updating(recipe_id):
+            self._remove(recipe_id)
+
+    def rank(self, ingredients, max_missing=None):
+        with self.reading():
+            hits = Counter()
+            for ingredient_id in set(ingredients):
+                hits.update(self._postings.get(ingredient_id, ()))
+            ranked = [
+                (len(self._recipes[recipe_id]) - count, -count, -recipe_id)
+                for recipe_id, count in hits.items()
+            ]
+        ranked.sort()
+        return [
+            -recipe_id for missing, _, recipe_id in ranked
+            if max_missing is None or missing <= max_missing
+        ]
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,76 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class TextShoppingListRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not data:
+            return b''
+        return '\n'.join(map(str, data.values())).encode(self.charset)
+
+    def stream(self, ingredients):
+        yield 'Список покупок:\n\n'
+        for ing in ingredients:
+            yield (
+                f'{ing["ingredient__name"]}: {ing["amount"]}'
+                f' {ing["ingredient__measurement_unit"]}\n'
+            )
+
+
+class CSVShoppingListRenderer(TextShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for ing in ingredients:
+            yield writer.writerow((
+                ing['ingredient__name'],
+                ing['amount'],
+                ing['ingredient__measurement_unit']
+            ))
+
+
+class JSONShoppingListRenderer(JSONRenderer):
+    def stream(self, ingredients):
+        separator = '['
+        for ing in ingredients:
+            yield separator + json.dumps({
+                'name': ing['ingredient__name'],
+                'measurement_unit': ing['ingredient__measurement_unit'],
+                'amount': ing['amount']
+            }, ensure_ascii=False)
+            separator = ',\n'
+        yield ']' if separator != '[' else '[]'
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(map(str, data.values()))
+        return data.encode(self.charset)
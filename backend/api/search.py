@@ -0,0 +1,285 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from functools import partial
+from math import log
+from threading import Lock
+
+import numpy as np
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from recipes.models import Ingredient, Recipe
+
+from .cache import ReferenceCache, VersionedIndex, ingredient_cache
+from .stemmer import tokenize
+
+NGRAM_SIZE = 3
+PREFIX_END = chr(0x10ffff)
+WORD = re.compile(r'\w+')
+SIMILARITY_THRESHOLD = 0.3
+FUZZY_LIMIT = 10
+SEARCH_CONFIG = 'russian'
+SEARCH_INDEX = 'recipe_search_idx'
+SEARCH_LIMIT = 500
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+
+
+def ngrams(value, size=NGRAM_SIZE):
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+def trigrams(value):
+    """Триграммы как в pg_trgm: каждое слово дополнено пробелами."""
+    grams = set()
+    for word in WORD.findall(value.casefold()):
+        grams.update(ngrams(f'  {word} '))
+    return grams
+
+
+class IngredientIndex:
+    """Поиск ингредиентов по началу и вхождению названия в памяти."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def _build(self, version):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (ingredient.name.casefold(),
+                                    -ingredient.id)
+        )
+        names = [ingredient.name.casefold() for ingredient in ingredients]
+        postings = defaultdict(lambda: array('I'))
+        padded = defaultdict(lambda: array('I'))
+        sizes = np.zeros(len(names), dtype=np.int32)
+        for position, name in enumerate(names):
+            for gram in ngrams(name):
+                postings[gram].append(position)
+            grams = trigrams(name)
+            sizes[position] = len(grams)
+            for gram in grams:
+                padded[gram].append(position)
+        padded = {
+            gram: np.frombuffer(positions, dtype=np.uint32)
+            for gram, positions in padded.items()
+        }
+        return version, names, ingredients, dict(postings), padded, sizes
+
+    def _get_state(self):
+        version = ingredient_cache.get_state()['version']
+        state = self._state
+        if state is None or state[0] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != version:
+                    state = self._build(version)
+                    self._state = state
+        return state
+
+    def search(self, value):
+        _, names, ingredients, postings, _, _ = self._get_state()
+        value = value.casefold()
+        start = bisect_left(names, value)
+        end = bisect_left(names, value + PREFIX_END, start)
+        if len(value) < NGRAM_SIZE:
+            candidates = range(len(names))
+        else:
+            grams = sorted(
+                ngrams(value), key=lambda gram: len(postings.get(gram, ()))
+            )
+            candidates = set(postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates.intersection_update(postings.get(gram, ()))
+            candidates = sorted(candidates)
+        contains = [
+            position for position in candidates
+            if not start <= position < end and value in names[position]
+        ]
+        return ingredients[start:end] + [
+            ingredients[position] for position in contains
+        ]
+
+    def fuzzy(self, value, limit=FUZZY_LIMIT):
+        """Ингредиенты, похожие на запрос по триграммам, с похожестью.
+
+        Похожесть считается как в pg_trgm: доля общих триграмм
+        от их объединения.
+        """
+        _, _, ingredients, _, padded, sizes = self._get_state()
+        query = trigrams(value)
+        grams = [padded[gram] for gram in query if gram in padded]
+        if not grams:
+            return []
+        shared = np.bincount(np.concatenate(grams), minlength=len(sizes))
+        similarity = shared / (sizes + len(query) - shared)
+        matches = np.flatnonzero(similarity >= SIMILARITY_THRESHOLD)
+        best = matches[np.lexsort((matches, -similarity[matches]))][:limit]
+        return [
+            (ingredients[position], float(similarity[position]))
+            for position in best
+        ]
+
+    def suggest(self, value):
+        """Совпадения по началу и вхождению, затем похожие с опечатками."""
+        found = self.search(value)
+        seen = {ingredient.id for ingredient in found}
+        return found + [
+            ingredient for ingredient, _ in self.fuzzy(value)
+            if ingredient.id not in seen
+        ]
+
+
+ingredient_index = IngredientIndex()
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def create_search_index(connection):
+    """GIN-индекс по search_vector, только на PostgreSQL.
+
+    Создаётся после migrate, а не в Meta.indexes: так makemigrations даёт
+    одинаковый результат при любой базе.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON '
+            f'{connection.ops.quote_name(Recipe._meta.db_table)} '
+            'USING gin (search_vector)'
+        )
+
+
+def search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+class RecipeSearchIndex(VersionedIndex):
+    """Полнотекстовый поиск по названию и описанию рецептов.
+
+    На PostgreSQL — столбец search_vector с GIN-индексом, на остальных
+    базах — инвертированный индекс по основам слов в памяти процесса.
+    """
+
+    cache = ReferenceCache('recipe-search')
+
+    def build(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        recipes = Recipe.objects.values_list('id', 'name', 'text')
+        for recipe_id, name, text in recipes.iterator():
+            self._add(recipe_id, name, text)
+
+    def _add(self, recipe_id, name, text):
+        weights = defaultdict(float)
+        for token in tokenize(name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(text):
+            weights[token] += TEXT_WEIGHT
+        for token, weight in weights.items():
+            self.postings[token][recipe_id] = weight
+        self.documents[recipe_id] = tuple(weights)
+
+    def _remove(self, recipe_id):
+        for token in self.documents.pop(recipe_id, ()):
+            self.postings[token].pop(recipe_id, None)
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def reload(self, recipe_ids):
+        recipes = Recipe.objects.filter(
+            id__in=recipe_ids
+        ).values_list('id', 'name', 'text')
+        for recipe_id in recipe_ids:
+            self._remove(recipe_id)
+        for recipe_id, name, text in recipes:
+            self._add(recipe_id, name, text)
+
+    def update_recipe(self, recipe):
+        """Вызывается из post_save рецепта.
+
+        search_vector пишется в той же транзакции, индекс в памяти
+        обновляется после коммита.
+        """
+        if uses_postgres():
+            Recipe.objects.filter(id=recipe.id).update(
+                search_vector=search_vector()
+            )
+            return
+        transaction.on_commit(
+            partial(self._replace, recipe.id, recipe.name, recipe.text)
+        )
+
+    def _replace(self, recipe_id, name, text):
+        with self.updating(recipe_id):
+            self._remove(recipe_id)
+            self._add(recipe_id, name, text)
+
+    def remove_recipe(self, recipe_id):
+        if not uses_postgres():
+            with self.updating(recipe_id):
+                self._remove(recipe_id)
+
+    def rebuild(self):
+        if uses_postgres():
+            Recipe.objects.update(search_vector=search_vector())
+        else:
+            self.cache.bump()
+
+    def rank(self, tokens):
+        """id и вес рецептов, содержащих все слова запроса."""
+        with self.reading():
+            postings = sorted(
+                (self.postings.get(token, {}) for token in set(tokens)),
+                key=len
+            )
+            total = len(self.documents)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+            scores = {
+                recipe_id: sum(
+                    posting[recipe_id] * log(1 + total / len(posting))
+                    for posting in postings
+                )
+                for recipe_id in candidates
+            }
+        return sorted(
+            scores.items(), key=lambda item: (-item[1], -item[0])
+        )[:SEARCH_LIMIT]
+
+    def filter(self, queryset, value):
+        tokens = tokenize(value)
+        if not tokens:
+            return queryset
+        if uses_postgres():
+            query = SearchQuery(value, config=SEARCH_CONFIG)
+            return queryset.filter(search_vector=query).annotate(
+                search_rank=SearchRank(F('search_vector'), query)
+            ).order_by('-search_rank', '-id')
+        ranked = self.rank(tokens)
+        if not ranked:
+            return queryset.none()
+        return queryset.filter(
+            id__in=[recipe_id for recipe_id, _ in ranked]
+        ).annotate(search_rank=Case(
+            *(When(id=recipe_id, then=Value(score))
+              for recipe_id, score in ranked),
+            output_field=FloatField()
+        )).order_by('-search_rank', '-id')
+
+
+recipe_search = RecipeSearchIndex()
@@ -1,15 +1,22 @@
-from base64 import b64decode
 from re import match, search
 
-from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
 from rest_framework import serializers
-from rest_framework.serializers import (BooleanField, CharField, ImageField,
-                                        ModelSerializer, ValidationError)
+from rest_framework.serializers import (CharField, ImageField, ModelSerializer,
+                                        ValidationError)
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from users.models import Subscriptions, User
 
+from .fast import refresh_snapshots
+from .images import (absolute_variant_urls, check_dimensions,
+                     decode_base64_image, image_pipeline, variant_urls)
+from .membership import get_membership
+from .pantry import pantry_index
+from .similarity import similarity_index
+
 
 class TagSerializer(ModelSerializer):
     class Meta:
@@ -68,13 +75,8 @@ class CustomUserSerializer(UserSerializer):
         write_only_field = ('password',)
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Subscriptions.objects.filter(
-            user=request.user,
-            author=obj.id
-        ).exists()
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.following
 
 
 class FollowSerializer(CustomUserSerializer):
@@ -96,14 +98,16 @@ class FollowSerializer(CustomUserSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes_limit = self.context.get('recipes_limit')
+            recipes = obj.recipes.all()[:recipes_limit]
         serializer = ShortRecipeSerializer(
             recipes,
             many=True,
@@ -131,10 +135,58 @@ class FollowSerializer(CustomUserSerializer):
         return data
 
 
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+
+class FacetsSerializer(serializers.Serializer):
+    facets = serializers.BooleanField(default=False)
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
+class SimilarSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=6)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = variant_urls(value)
+        if request is None:
+            return urls
+        return absolute_variant_urls(urls, request)
+
+
 class ShortRecipeSerializer(ModelSerializer):
+    images = ImageVariantsField(source='image_variants')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+
+class IngredientAmountSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(
+        min_value=1,
+        max_value=32767,
+        error_messages={'min_value': 'Количество должно быть больше 0'}
+    )
 
 
 class IngredientRecipeSerializer(ModelSerializer):
@@ -152,8 +204,20 @@ class Base64ImageField(ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            data = decode_base64_image(imgstr, 'temp.' + ext)
+        image = super().to_internal_value(data)
+        check_dimensions(image.image)
+        return image
+
+
+def recipe_prefetches():
+    return (
+        Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ),
+        'tags',
+    )
 
 
 class RecipeSerializer(ModelSerializer):
@@ -164,9 +228,10 @@ class RecipeSerializer(ModelSerializer):
         source='recipeingredient_set',
     )
     author = CustomUserSerializer(read_only=True)
-    is_favorited = BooleanField(read_only=True, default=None)
-    is_in_shopping_cart = BooleanField(read_only=True, default=None)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    images = ImageVariantsField(source='image_variants')
 
     class Meta:
         model = Recipe
@@ -177,18 +242,55 @@ class RecipeSerializer(ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
             'is_favorited',
             'is_in_shopping_cart'
         )
 
+    def to_representation(self, instance):
+        if 'recipeingredient_set' not in getattr(
+            instance, '_prefetched_objects_cache', {}
+        ):
+            prefetch_related_objects([instance], *recipe_prefetches())
+        return super().to_representation(instance)
+
+    def get_is_favorited(self, obj):
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.cart
+
+    @staticmethod
+    def update_indexes(recipe, ingredients, tags):
+        ingredient_ids = [ingredient.get('id') for ingredient in ingredients]
+
+        def update():
+            for index in (pantry_index, similarity_index):
+                index.update_recipe(recipe.id, ingredient_ids, tags)
+
+        transaction.on_commit(update)
+        refresh_snapshots((recipe.id,))
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
-        tags = self.initial_data.get('tags')
-        ingredients = self.initial_data.get('ingredients')
+        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        for tag in tags:
-            RecipeTag.objects.create(tag_id=tag, recipe=recipe)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(tag_id=tag, recipe=recipe) for tag in tags
+        )
 
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
@@ -196,38 +298,130 @@ class RecipeSerializer(ModelSerializer):
                 ingredient_id=ingredient.get('id'),
                 amount=ingredient.get('amount')
             ) for ingredient in ingredients)
+        self.update_indexes(recipe, ingredients, tags)
+        image_pipeline.schedule(recipe)
         return recipe
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        tags = set(tags)
+        existing = set(
+            RecipeTag.objects.filter(
+                recipe=recipe
+            ).values_list('tag_id', flat=True)
+        )
+        if existing - tags:
+            RecipeTag.objects.filter(
+                recipe=recipe,
+                tag_id__in=existing - tags
+            ).delete()
+        if tags - existing:
+            RecipeTag.objects.bulk_create(
+                RecipeTag(tag_id=tag, recipe=recipe)
+                for tag in tags - existing
+            )
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        removed = [
+            row.id for ingredient_id, row in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if amounts.keys() - existing.keys():
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                ) for ingredient_id, amount in amounts.items()
+                if ingredient_id not in existing
+            )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.image = validated_data.get('image', instance.image)
+        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients')
+        update_fields = ['name', 'text', 'cooking_time']
+        if 'image' in validated_data:
+            instance.image = validated_data['image']
+            instance.image_variants = {}
+            update_fields += ['image', 'image_variants']
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time',
             instance.cooking_time
         )
-        tags = self.initial_data.get('tags')
-        RecipeTag.objects.filter(recipe=instance).delete()
-        RecipeTag.objects.bulk_create(
-            RecipeTag(
-                tag_id=tag,
-                recipe=instance,
-
-            ) for tag in tags)
-
-        ingredients = self.initial_data.get('ingredients')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-
-        RecipeIngredient.objects.bulk_create(
-            RecipeIngredient(
-                recipe=instance,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount')
-            ) for ingredient in ingredients)
+        self.update_tags(instance, tags)
+        self.update_ingredients(instance, ingredients)
 
-        instance.save()
+        instance.save(update_fields=update_fields)
+        self.update_indexes(instance, ingredients, tags)
+        if 'image' in validated_data:
+            image_pipeline.schedule(instance)
         return instance
 
+    @staticmethod
+    def check_ingredients(ingredients):
+        serializer = IngredientAmountSerializer(data=ingredients, many=True)
+        if not serializer.is_valid():
+            raise ValidationError({'ingredients': serializer.errors})
+        items = serializer.validated_data
+        found = set(Ingredient.objects.filter(
+            id__in={item['id'] for item in items}
+        ).values_list('id', flat=True))
+        errors, seen = [], set()
+        for item in items:
+            if item['id'] not in found:
+                errors.append({'id': [f'Ингредиент {item["id"]} не найден']})
+            elif item['id'] in seen:
+                errors.append({'id': ['Ингридиенты не должны повторяться']})
+            else:
+                errors.append({})
+            seen.add(item['id'])
+        if any(errors):
+            raise ValidationError({'ingredients': errors})
+        return items
+
+    @staticmethod
+    def check_tags(tags):
+        field = serializers.ListField(child=serializers.IntegerField())
+        try:
+            tags = field.run_validation(tags)
+        except ValidationError as error:
+            raise ValidationError({'tags': error.detail})
+        found = set(
+            Tag.objects.filter(id__in=set(tags)).values_list('id', flat=True)
+        )
+        errors, seen = {}, set()
+        for index, tag in enumerate(tags):
+            if tag not in found:
+                errors[index] = [f'Тег {tag} не найден']
+            elif tag in seen:
+                errors[index] = ['Теги должны быть уникальными']
+            seen.add(tag)
+        if errors:
+            raise ValidationError({'tags': errors})
+        return tags
+
     def validate(self, data):
         ingredients = self.initial_data.get('ingredients')
         tags = self.initial_data.get('tags')
@@ -237,29 +431,11 @@ class RecipeSerializer(ModelSerializer):
                                  'минимум один ингредиент')
                  }
             )
-        array_of_ingredients = []
-        for ingredient in ingredients:
-
-            if ingredient['id'] in array_of_ingredients:
-                raise ValidationError(
-                    detail='Ингридиенты не должны повторяться',
-                    code=HTTP_400_BAD_REQUEST
-                )
-            if int(ingredient.get('amount')) < 1:
-                raise ValidationError(
-                    {'amount': 'Количество должно быть больше 0'},
-                    code=HTTP_400_BAD_REQUEST
-                )
-            array_of_ingredients.append(ingredient['id'])
         if not tags:
             raise ValidationError(
                 {'tags': ('Нужно выбрать хотя бы один тег')
                  }
             )
-        array_of_tags = set(tags)
-        if len(array_of_tags) != len(tags):
-            raise ValidationError(
-                detail='Теги должны быть уникальными',
-                code=HTTP_400_BAD_REQUEST
-            )
+        data['tags'] = self.check_tags(tags)
+        data['ingredients'] = self.check_ingredients(ingredients)
         return data
@@ -0,0 +1,99 @@
+from django.db import connections, transaction
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import forget_tokens
+from .cache import ingredient_cache, tag_cache
+from .fast import invalidate_snapshots
+from .pantry import pantry_index
+from .search import create_search_index, ingredient_index, recipe_search
+from .similarity import similarity_index
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    if sender.name == 'recipes':
+        create_search_index(connections[using])
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    tag_cache.bump()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    ingredient_cache.bump()
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_indexes(**kwargs):
+    pantry_index.cache.bump()
+    similarity_index.cache.bump()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_recipe_indexes(instance, **kwargs):
+    recipe_id = instance.id
+
+    def remove():
+        for index in (pantry_index, similarity_index, recipe_search):
+            index.remove_recipe(recipe_id)
+
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        recipe_search.update_recipe(instance)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_snapshot(instance, **kwargs):
+    invalidate_snapshots((instance.id,))
+
+
+@receiver((post_save, post_delete), sender=RecipeTag)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_related_snapshot(instance, **kwargs):
+    invalidate_snapshots((instance.recipe_id,))
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def invalidate_tag_snapshots(instance, **kwargs):
+    invalidate_snapshots(RecipeTag.objects.filter(
+        tag=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def invalidate_ingredient_snapshots(instance, **kwargs):
+    invalidate_snapshots(RecipeIngredient.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_snapshots(instance, **kwargs):
+    invalidate_snapshots(Recipe.objects.filter(
+        author=instance
+    ).values_list('id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Token)
+def forget_token(instance, **kwargs):
+    forget_tokens((instance.key,))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(instance, **kwargs):
+    forget_tokens(Token.objects.filter(
+        user_id=instance.id
+    ).values_list('key', flat=True))
@@ -0,0 +1,168 @@
+from collections import defaultdict
+
+import numpy as np
+from recipes.models import RecipeIngredient, RecipeTag
+
+from .cache import ReferenceCache, VersionedIndex
+
+
+def features(ingredient_ids, tag_ids):
+    return np.unique(np.fromiter(
+        [2 * pk for pk in ingredient_ids] + [2 * pk + 1 for pk in tag_ids],
+        dtype=np.int64
+    ))
+
+
+class RecipeMatrix:
+    """Разреженная матрица «рецепт × (ингредиенты и теги)» в формате CSC.
+
+    Сходство с рецептом (коэффициент Жаккара) считается за один векторный
+    проход: пересечения — np.bincount по рецептам общих признаков.
+    Изменённые после сборки строки копятся в _pending и сравниваются
+    напрямую; матрица пересобирается, когда их больше MAX_PENDING.
+    """
+
+    MAX_PENDING = 256
+
+    def __init__(self, rows=()):
+        self.rows = dict(rows)
+        self._compiled = None
+        self._pending = set()
+
+    def set_row(self, recipe_id, row):
+        self.rows[recipe_id] = row
+        self._invalidate(recipe_id)
+
+    def remove_row(self, recipe_id):
+        self.rows.pop(recipe_id, None)
+        self._invalidate(recipe_id)
+
+    def _invalidate(self, recipe_id):
+        if self._compiled is None:
+            return
+        self._pending.add(recipe_id)
+        if len(self._pending) > self.MAX_PENDING:
+            self._compiled = None
+
+    def compile(self):
+        self._pending = set()
+        recipe_ids = np.fromiter(self.rows, dtype=np.int64)
+        sizes = np.fromiter(
+            map(len, self.rows.values()), dtype=np.int32,
+            count=len(recipe_ids)
+        )
+        columns = (np.concatenate(list(self.rows.values()))
+                   if self.rows else np.empty(0, dtype=np.int64))
+        feature_ids, columns = np.unique(columns, return_inverse=True)
+        order = np.argsort(columns, kind='stable')
+        indices = np.repeat(
+            np.arange(len(recipe_ids), dtype=np.int32), sizes
+        )[order]
+        indptr = np.searchsorted(
+            columns[order], np.arange(len(feature_ids) + 1)
+        )
+        self._compiled = recipe_ids, sizes, feature_ids, indptr, indices
+        return self._compiled
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._compiled or self.compile())
+
+    def _compiled_scores(self, row):
+        recipe_ids, sizes, feature_ids, indptr, indices = (
+            self._compiled or self.compile()
+        )
+        columns = np.searchsorted(feature_ids, row)
+        known = columns < len(feature_ids)
+        known[known] = feature_ids[columns[known]] == row[known]
+        candidates = np.concatenate([np.empty(0, dtype=np.int32)] + [
+            indices[indptr[column]:indptr[column + 1]]
+            for column in columns[known]
+        ])
+        intersection = np.bincount(candidates, minlength=len(recipe_ids))
+        scores = intersection / (sizes + len(row) - intersection)
+        if self._pending:
+            scores[np.isin(recipe_ids, list(self._pending))] = 0
+        return recipe_ids, scores
+
+    def _pending_scores(self, row):
+        recipe_ids = np.fromiter(
+            (pk for pk in self._pending if pk in self.rows), dtype=np.int64
+        )
+        scores = np.empty(len(recipe_ids))
+        for position, pk in enumerate(recipe_ids.tolist()):
+            other = self.rows[pk]
+            intersection = len(np.intersect1d(row, other, assume_unique=True))
+            scores[position] = intersection / (
+                len(other) + len(row) - intersection
+            )
+        return recipe_ids, scores
+
+    def similar(self, recipe_id, limit):
+        row = self.rows.get(recipe_id)
+        if row is None or not len(row):
+            return []
+        recipe_ids, scores = self._compiled_scores(row)
+        if self._pending:
+            pending_ids, pending_scores = self._pending_scores(row)
+            recipe_ids = np.concatenate((recipe_ids, pending_ids))
+            scores = np.concatenate((scores, pending_scores))
+        scores[recipe_ids == recipe_id] = 0
+        found = np.flatnonzero(scores)
+        if len(found) > limit:
+            threshold = -np.partition(-scores[found], limit - 1)[limit - 1]
+            found = found[scores[found] >= threshold]
+        found = found[np.lexsort((-recipe_ids[found], -scores[found]))]
+        return recipe_ids[found[:limit]].tolist()
+
+
+class SimilarityIndex(VersionedIndex):
+    cache = ReferenceCache('similarity')
+
+    def __init__(self):
+        super().__init__()
+        self._matrix = RecipeMatrix()
+
+    @staticmethod
+    def load_rows(ingredients, tags):
+        rows = defaultdict(lambda: (set(), set()))
+        for recipe_id, ingredient_id in ingredients.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator():
+            rows[recipe_id][0].add(ingredient_id)
+        for recipe_id, tag_id in tags.values_list(
+            'recipe_id', 'tag_id'
+        ).iterator():
+            rows[recipe_id][1].add(tag_id)
+        return {recipe_id: features(*row) for recipe_id, row in rows.items()}
+
+    def build(self):
+        self._matrix = RecipeMatrix(self.load_rows(
+            RecipeIngredient.objects.all(), RecipeTag.objects.all()
+        ))
+
+    def reload(self, recipe_ids):
+        rows = self.load_rows(
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids),
+            RecipeTag.objects.filter(recipe_id__in=recipe_ids)
+        )
+        for recipe_id in recipe_ids:
+            if recipe_id in rows:
+                self._matrix.set_row(recipe_id, rows[recipe_id])
+            else:
+                self._matrix.remove_row(recipe_id)
+
+    def update_recipe(self, recipe_id, ingredient_ids, tag_ids):
+        with self.updating(recipe_id):
+            self._matrix.set_row(recipe_id, features(ingredient_ids, tag_ids))
+
+    def remove_recipe(self, recipe_id):
+        with self.updating(recipe_id):
+            self._matrix.remove_row(recipe_id)
+
+    def similar(self, recipe_id, limit):
+        with self.reading():
+            return self._matrix.similar(recipe_id, limit)
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,116 @@
+"""Стеммер Портера (Snowball) для русского языка."""
+import re
+
+VOWELS = 'аеиоуыэюя'
+WORD = re.compile(r'[а-яёa-z0-9]+')
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    (),
+    ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+     'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+     'ая', 'яя', 'ою', 'ею'),
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+     'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    (),
+    ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и',
+     'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о',
+     'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я'),
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def region(word, start=0):
+    """Позиция после первой согласной, следующей за гласной."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def strip(word, groups):
+    """Отрезает самое длинное окончание из групп.
+
+    Окончания первой группы допустимы только после «а» или «я».
+    Возвращает None, если окончание не найдено.
+    """
+    best = None
+    for group, endings in enumerate(groups):
+        for ending in endings:
+            if word.endswith(ending) and (
+                best is None or len(ending) > len(best[1])
+            ):
+                best = group, ending
+    if best is None:
+        return None
+    group, ending = best
+    stem = word[:-len(ending)]
+    if group == 0 and not stem.endswith(('а', 'я')):
+        return None
+    return stem
+
+
+def strip_optional(word, groups):
+    result = strip(word, groups)
+    return word if result is None else result
+
+
+def strip_inflection(rv):
+    result = strip(rv, PERFECTIVE_GERUND)
+    if result is not None:
+        return result
+    rv = strip_optional(rv, REFLEXIVE)
+    result = strip(rv, ADJECTIVE)
+    if result is not None:
+        return strip_optional(result, PARTICIPLE)
+    for groups in (VERB, NOUN):
+        result = strip(rv, groups)
+        if result is not None:
+            return result
+    return rv
+
+
+def strip_superlative(rv):
+    if rv.endswith('нн'):
+        return rv[:-1]
+    for ending in SUPERLATIVE:
+        if rv.endswith(ending):
+            rv = rv[:-len(ending)]
+            return rv[:-1] if rv.endswith('нн') else rv
+    return rv[:-1] if rv.endswith('ь') else rv
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv_start = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS), len(word)
+    )
+    r2 = region(word, region(word)) - rv_start
+    rv = strip_inflection(word[rv_start:])
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    for ending in DERIVATIONAL:
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2:
+            rv = rv[:-len(ending)]
+            break
+    return word[:rv_start] + strip_superlative(rv)
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD.findall(text.lower())]
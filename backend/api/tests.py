@@ -0,0 +1,242 @@
+import re
+import shutil
+import tempfile
+from base64 import b64encode
+from io import BytesIO
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscriptions, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+WRITE = re.compile(r'^\s*(INSERT INTO|UPDATE|DELETE FROM)\s+"(\w+)"', re.I)
+
+
+def image_base64():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+def writes(queries, table):
+    """Число INSERT/UPDATE/DELETE по таблице, сгруппированное по типу."""
+    counts = {}
+    for query in queries:
+        found = WRITE.match(query['sql'])
+        if found and found.group(2) == table:
+            kind = found.group(1).split()[0].upper()
+            counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class RecipeApiTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Автор', last_name='Авторов'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password', first_name='Читатель', last_name='Читаев'
+        )
+        Subscriptions.objects.create(user=cls.reader, author=cls.author)
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        for i in range(25):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10, image='recipes/images/test.png'
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag)
+                for tag in cls.tags[:1 + i % 3]
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in cls.ingredients[:1 + i % 5]
+            )
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def count_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class RecipeListQueriesTest(RecipeApiTestCase):
+    def test_query_count_does_not_depend_on_page_size(self):
+        expected = self.count_queries('/api/recipes/?limit=2')
+        self.client.get('/api/recipes/?limit=20')
+        with self.assertNumQueries(expected):
+            response = self.client.get('/api/recipes/?limit=20')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_anonymous_query_count_does_not_depend_on_page_size(self):
+        self.client.credentials()
+        self.assertEqual(
+            self.count_queries('/api/recipes/?limit=2'),
+            self.count_queries('/api/recipes/?limit=20')
+        )
+
+
+class RecipeWriteQueriesTest(RecipeApiTestCase):
+    def payload(self, tags, ingredients, **fields):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+            **fields,
+        }
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/recipes/', self.payload(
+            self.tags[:2],
+            [(self.ingredients[0], 10), (self.ingredients[1], 20)],
+            image=image_base64()
+        ), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.recipe_id = response.data['id']
+
+    def patch(self, tags, ingredients, **fields):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe_id}/',
+                self.payload(tags, ingredients, **fields),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return queries.captured_queries
+
+    def test_create_inserts_relations_in_one_statement_each(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/recipes/', self.payload(
+                self.tags,
+                [(ingredient, 5) for ingredient in self.ingredients],
+                image=image_base64()
+            ), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            writes(queries, 'recipes_recipetag'), {'INSERT': 1}
+        )
+        self.assertEqual(
+            writes(queries, 'recipes_recipeingredient'), {'INSERT': 1}
+        )
+
+    def test_text_only_update_does_not_touch_relations(self):
+        queries = self.patch(
+            self.tags[:2],
+            [(self.ingredients[0], 10), (self.ingredients[1], 20)],
+            text='Новое описание'
+        )
+        self.assertEqual(writes(queries, 'recipes_recipetag'), {})
+        self.assertEqual(writes(queries, 'recipes_recipeingredient'), {})
+
+    def test_added_tag_is_one_insert(self):
+        queries = self.patch(
+            self.tags,
+            [(self.ingredients[0], 10), (self.ingredients[1], 20)]
+        )
+        self.assertEqual(
+            writes(queries, 'recipes_recipetag'), {'INSERT': 1}
+        )
+
+    def test_removed_tag_is_one_delete(self):
+        queries = self.patch(
+            self.tags[:1],
+            [(self.ingredients[0], 10), (self.ingredients[1], 20)]
+        )
+        self.assertEqual(
+            writes(queries, 'recipes_recipetag'), {'DELETE': 1}
+        )
+
+    def test_changed_amounts_are_one_update(self):
+        queries = self.patch(
+            self.tags[:2],
+            [(self.ingredients[0], 11), (self.ingredients[1], 21)]
+        )
+        self.assertEqual(
+            writes(queries, 'recipes_recipeingredient'), {'UPDATE': 1}
+        )
+
+    def test_added_ingredient_is_one_insert(self):
+        queries = self.patch(self.tags[:2], [
+            (self.ingredients[0], 10), (self.ingredients[1], 20),
+            (self.ingredients[2], 30), (self.ingredients[3], 40),
+        ])
+        self.assertEqual(
+            writes(queries, 'recipes_recipeingredient'), {'INSERT': 1}
+        )
+
+    def test_removed_ingredient_is_one_delete(self):
+        queries = self.patch(self.tags[:2], [(self.ingredients[0], 10)])
+        self.assertEqual(
+            writes(queries, 'recipes_recipeingredient'), {'DELETE': 1}
+        )
+
+
+class RecipeSimilarTest(RecipeApiTestCase):
+    def test_non_numeric_id_is_not_found(self):
+        response = self.client.get('/api/recipes/abc/similar/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ShoppingCartDownloadTest(RecipeApiTestCase):
+    def test_errors_are_json(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.client.credentials()
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class ReferenceCacheTest(RecipeApiTestCase):
+    def test_missing_tag_is_not_modified_only_if_it_exists(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        response = self.client.get(
+            f'/api/tags/{self.tags[0].id}/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            '/api/tags/999999/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 404)
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import IngredientViewSet, MetricsView, RecipeViewSet, TagViewSet
 
 router = DefaultRouter()
 
@@ -10,5 +10,6 @@ router.register('tags', TagViewSet)
 router.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
 ]
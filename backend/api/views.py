@@ -1,37 +1,58 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (Count, F, OuterRef, Prefetch, Subquery, Sum,
+                              prefetch_related_objects)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from recipes.models import (Favorites, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
                                    HTTP_400_BAD_REQUEST)
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscriptions, User
 
+from .cache import ingredient_cache, tag_cache
+from .fast import serialize_recipes
+from .feed import feed_ids
 from .filters import IngredientFilter, RecipeFilter
+from .membership import bump_membership, get_membership, lock_membership
+from .metrics import registry
+from .mixins import ReferenceCacheMixin
+from .pagination import LimitCursorPagination
+from .pantry import pantry_index
 from .permissions import AuthorOrReadOnly
-from .serializers import (CustomUserSerializer, FollowSerializer,
-                          IngredientSerializer, RecipeSerializer,
-                          ShortRecipeSerializer, TagSerializer)
+from .renderers import SHOPPING_LIST_RENDERERS, PrometheusRenderer
+from .search import ingredient_index
+from .serializers import (CustomUserSerializer, FacetsSerializer,
+                          FollowSerializer, IngredientSerializer,
+                          PantrySerializer, RecipeIdsSerializer,
+                          RecipeSerializer, RecipesLimitSerializer,
+                          ShortRecipeSerializer, SimilarSerializer,
+                          TagSerializer, recipe_prefetches)
+from .similarity import similarity_index
 
 User = get_user_model()
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
+    reference_cache = tag_cache
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
@@ -39,16 +60,50 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     search_fields = ('^name',)
     filterset_class = IngredientFilter
+    reference_cache = ingredient_cache
+    uncached_params = ('name',)
+
+    def filter_queryset(self, queryset):
+        name = self.request.query_params.get('name')
+        if self.action == 'list' and name:
+            return ingredient_index.suggest(name)
+        return super().filter_queryset(queryset)
 
 
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
 
+    @staticmethod
+    def get_recipes_limit(request):
+        serializer = RecipesLimitSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
+    @staticmethod
+    def get_limited_recipes(recipes_limit):
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time', 'author'
+        )
+        if recipes_limit is None:
+            return recipes
+        latest = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).values('id')[:recipes_limit]
+        return recipes.filter(id__in=Subquery(latest))
+
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        follows = User.objects.filter(following__user=request.user)
+        recipes_limit = self.get_recipes_limit(request)
+        follows = User.objects.filter(following__user=request.user).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('id')
         pages = self.paginate_queryset(follows)
+        prefetch_related_objects(pages, Prefetch(
+            'recipes',
+            queryset=self.get_limited_recipes(recipes_limit),
+            to_attr='limited_recipes'
+        ))
         serializer = FollowSerializer(
             pages,
             many=True,
@@ -66,7 +121,10 @@ class CustomUserViewSet(UserViewSet):
             serializer = FollowSerializer(
                 author,
                 data=request.data,
-                context={'request': request}
+                context={
+                    'request': request,
+                    'recipes_limit': self.get_recipes_limit(request)
+                }
             )
             if not serializer.is_valid():
                 return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
@@ -74,6 +132,7 @@ class CustomUserViewSet(UserViewSet):
                 user=request.user,
                 author=author
             )
+            bump_membership(request.user)
             return Response(serializer.data, status=HTTP_201_CREATED)
         if not Subscriptions.objects.filter(
             user=request.user,
@@ -87,49 +146,131 @@ class CustomUserViewSet(UserViewSet):
             user=request.user,
             author=author
         ).delete()
+        bump_membership(request.user)
         return Response(status=HTTP_204_NO_CONTENT)
 
 
 class RecipeViewSet(ModelViewSet):
 
     serializer_class = RecipeSerializer
+    lookup_value_regex = r'\d+'
     permission_classes = (AuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
     def get_queryset(self):
-        user = self.request.user
-        favorites = Favorites.objects.filter(user=user, recipe=OuterRef('pk'))
-        shopping_cart = ShoppingCart.objects.filter(
-            user=user, recipe=OuterRef('pk')
-        )
-        return Recipe.objects.select_related(
-            'author').prefetch_related('ingredients').annotate(
-            is_favorited=Exists(favorites),
-            is_in_shopping_cart=Exists(shopping_cart)
+        return Recipe.objects.select_related('author').prefetch_related(
+            *recipe_prefetches()
         )
 
+    def list(self, request, *args, **kwargs):
+        params = FacetsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        if not settings.FAST_RECIPE_READS:
+            response = super().list(request, *args, **kwargs)
+        else:
+            queryset = self.filter_queryset(Recipe.objects.all())
+            page = self.paginate_queryset(queryset.values(
+                'id', 'favorites_count', *queryset.query.annotations
+            ))
+            response = self.get_paginated_response(
+                serialize_recipes([recipe['id'] for recipe in page], request)
+            )
+        if params.validated_data['facets']:
+            filterset = DjangoFilterBackend().get_filterset(
+                request, Recipe.objects.all(), self
+            )
+            response.data['facets'] = {'tags': filterset.tag_facets()}
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.FAST_RECIPE_READS:
+            return super().retrieve(request, *args, **kwargs)
+        pk = kwargs['pk']
+        recipes = serialize_recipes([int(pk)], request) if pk.isdigit() else []
+        if not recipes:
+            raise NotFound
+        return Response(recipes[0])
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-    @staticmethod
-    def send_message(ingredients):
-        filename = 'shopping_list.txt'
-        shopping_list = (
-            'Список покупок:\n\n'
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
         )
-        for ing in ingredients:
-            shopping_list += (
-                f'{ing["ingredient__name"]}: {ing["amount"]}'
-                f' {ing["ingredient__measurement_unit"]}\n'
-            )
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
-        )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        if response.status_code >= 400 and isinstance(
+            getattr(response, 'accepted_renderer', None),
+            SHOPPING_LIST_RENDERERS
+        ):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
         return response
 
     @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        paginator = LimitCursorPagination()
+        cursor = paginator.decode_cursor(request)
+        limit = paginator.get_page_size(request) + 1
+        position, reverse = None, False
+        if cursor is not None:
+            limit += cursor.offset
+            reverse = cursor.reverse
+            if cursor.position is not None:
+                paginator.ordering = ('-id',)
+                position = paginator.parse_position(cursor.position)[0]
+        recipes = Recipe.objects.filter(id__in=feed_ids(
+            get_membership(request).following, limit, position, reverse
+        ))
+        if settings.FAST_RECIPE_READS:
+            page = paginator.paginate_queryset(
+                recipes.values('id'), request, self
+            )
+            data = serialize_recipes(
+                [recipe['id'] for recipe in page], request
+            )
+        else:
+            page = paginator.paginate_queryset(
+                recipes.select_related('author').prefetch_related(
+                    *recipe_prefetches()
+                ),
+                request, self
+            )
+            data = self.get_serializer(page, many=True).data
+        return paginator.get_paginated_response(data)
+
+    @action(detail=False)
+    def pantry(self, request):
+        params = PantrySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ranked = pantry_index.rank(**params.validated_data)
+        page = self.paginate_queryset(ranked)
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe, id=pk)
+        params = SimilarSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        similar = similarity_index.similar(
+            recipe.id, params.validated_data['limit']
+        )
+        recipes = self.get_queryset().in_bulk(similar)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in similar if pk in recipes],
+            many=True
+        )
+        return Response(serializer.data)
+
+    @action(detail=False,
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_LIST_RENDERERS
+            )
     def download_shopping_cart(self, request):
         if not ShoppingCart.objects.filter(
                 user=request.user
@@ -143,61 +284,136 @@ class RecipeViewSet(ModelViewSet):
         ).values(
             'ingredient__name',
             'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        return self.send_message(ingredients)
+        ).annotate(
+            amount=Sum('amount')
+        ).order_by('ingredient__name').iterator()
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_list.{renderer.format}'
+        )
+        return response
 
-    @action(methods=['post', 'delete'],
-            detail=True,
-            permission_classes=(IsAuthenticated,)
-            )
-    def shopping_cart(self, request, pk):
+    @staticmethod
+    def add_or_remove(request, pk, model, counter, error):
         recipe = get_object_or_404(Recipe, id=pk)
+        recipes = Recipe.objects.filter(id=recipe.id)
         if request.method == 'POST':
+            with transaction.atomic():
+                lock_membership(request.user)
+                if model.objects.filter(
+                    user=request.user,
+                    recipe=recipe
+                ).exists():
+                    return Response(
+                        {'errors': error},
+                        status=HTTP_400_BAD_REQUEST
+                    )
+                model.objects.create(
+                    user=request.user,
+                    recipe=recipe
+                )
+                recipes.update(**{counter: F(counter) + 1})
+            bump_membership(request.user)
             serializer = ShortRecipeSerializer(recipe)
-            if ShoppingCart.objects.filter(
+            return Response(serializer.data, status=HTTP_201_CREATED)
+
+        with transaction.atomic():
+            lock_membership(request.user)
+            deleted, _ = model.objects.filter(
                 user=request.user,
                 recipe=recipe
-            ).exists():
-                return Response(
-                    {'errors': 'Этот рецепт уже в списке покупок'},
-                    status=HTTP_400_BAD_REQUEST
+            ).delete()
+            if deleted:
+                recipes.update(**{counter: F(counter) - deleted})
+        bump_membership(request.user)
+        return Response(status=HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def bulk_add_or_remove(request, model, counter):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        relations = model.objects.filter(
+            user=request.user,
+            recipe_id__in=found
+        )
+        with transaction.atomic():
+            lock_membership(request.user)
+            present = set(relations.values_list('recipe_id', flat=True))
+            if request.method == 'POST':
+                changed = found - present
+                model.objects.bulk_create(
+                    (model(user=request.user, recipe_id=pk)
+                     for pk in changed),
+                    ignore_conflicts=True
                 )
-            ShoppingCart.objects.create(
-                user=request.user,
-                recipe=recipe
+                delta, statuses = 1, ('added', 'exists')
+            else:
+                relations.delete()
+                changed = present
+                delta, statuses = -1, ('removed', 'absent')
+            Recipe.objects.filter(id__in=changed).update(
+                **{counter: F(counter) + delta}
             )
-            return Response(serializer.data, status=HTTP_201_CREATED)
+        bump_membership(request.user)
+        return Response([
+            {
+                'id': pk,
+                'status': (statuses[pk not in changed] if pk in found
+                           else 'not_found')
+            } for pk in ids
+        ])
 
-        ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=recipe
-        ).delete()
-        return Response(status=HTTP_204_NO_CONTENT)
+    @action(methods=['post', 'delete'],
+            detail=False,
+            url_path='shopping_cart',
+            url_name='shopping-cart-bulk',
+            permission_classes=(IsAuthenticated,)
+            )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_add_or_remove(request, ShoppingCart, 'in_carts_count')
+
+    @action(methods=['post', 'delete'],
+            detail=False,
+            url_path='favorite',
+            url_name='favorite-bulk',
+            permission_classes=(IsAuthenticated,)
+            )
+    def favorite_bulk(self, request):
+        return self.bulk_add_or_remove(request, Favorites, 'favorites_count')
 
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=(IsAuthenticated,)
             )
-    def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if request.method == 'POST':
-            serializer = ShortRecipeSerializer(recipe)
-            if Favorites.objects.filter(
-                user=request.user,
-                recipe=recipe
-            ).exists():
-                return Response(
-                    {'errors': 'Этот рецепт уже в избранном'},
-                    status=HTTP_400_BAD_REQUEST
-                )
-            Favorites.objects.create(
-                user=request.user,
-                recipe=recipe
+    def shopping_cart(self, request, pk):
+        return self.add_or_remove(
+            request, pk, ShoppingCart, 'in_carts_count',
+            'Этот рецепт уже в списке покупок'
+        )
+
+    @action(methods=['post', 'delete'],
+            detail=True,
+            permission_classes=(IsAuthenticated,)
             )
-            return Response(serializer.data, status=HTTP_201_CREATED)
+    def favorite(self, request, pk):
+        return self.add_or_remove(
+            request, pk, Favorites, 'favorites_count',
+            'Этот рецепт уже в избранном'
+        )
 
-        Favorites.objects.filter(
-            user=request.user,
-            recipe=recipe
-        ).delete()
-        return Response(status=HTTP_204_NO_CONTENT)
+
+class MetricsView(APIView):
+    """Гистограммы RequestMetricsMiddleware этого процесса."""
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(registry.exposition())
@@ -52,6 +52,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_APPS + LOCAL_APPS
 
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +94,31 @@ DATABASES = {
     }
 }
 
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', default='foodgram')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    # Версии справочников и индексов: не вытесняются вместе с данными.
+    'versions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION',
+            default='foodgram-versions' if CACHE_BACKEND.endswith('LocMemCache') else CACHE_LOCATION
+        ),
+        'KEY_PREFIX': 'versions',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 6},
+    },
+}
+
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', default=60 * 60 * 24))
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', default=60 * 60))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=60 * 5))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -139,11 +165,19 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageLimitPagination',
 }
 
+FAST_RECIPE_READS = os.getenv('FAST_RECIPE_READS', default='False') == 'True'
+RECIPE_SNAPSHOT_TIMEOUT = int(os.getenv('RECIPE_SNAPSHOT_TIMEOUT', default=60 * 60 * 24))
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', default='False') == 'True'
+
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', default=5 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', default=40_000_000))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
 
 DJOSER = {
     'HIDE_USERS': False,
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from posixpath import join
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.models import Recipe
+
+IMAGES_DIR = 'recipes/images'
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield join(path, name)
+    for directory in directories:
+        yield from walk(storage, join(path, directory))
+
+
+def referenced_images():
+    names = set()
+    recipes = Recipe.objects.values_list('image', 'image_variants')
+    for image, variants in recipes.iterator():
+        names.add(image)
+        for formats in variants.values():
+            names.update(formats.values())
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, min_age, dry_run, **kwargs):
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.exists(IMAGES_DIR):
+            return
+        threshold = timezone.now() - timedelta(seconds=min_age)
+        referenced = referenced_images()
+        removed = freed = 0
+        for name in walk(storage, IMAGES_DIR):
+            if name in referenced:
+                continue
+            if storage.get_modified_time(name) > threshold:
+                continue
+            freed += storage.size(name)
+            removed += 1
+            if not dry_run:
+                storage.delete(name)
+        action = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {freed / 1024 / 1024:.1f} МиБ'
+        ))
@@ -0,0 +1,162 @@
+from itertools import accumulate
+from random import Random
+
+from api.cache import ingredient_cache, tag_cache
+from api.pantry import pantry_index
+from api.search import recipe_search
+from api.similarity import similarity_index
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from recipes.models import (Favorites, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from users.models import Subscriptions, User
+
+COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F4C430', '#4A90E2')
+
+
+def zipf_weights(count, exponent=1.1):
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = ('Генерирует пользователей, рецепты, избранное, корзины и '
+            'подписки с неравномерным распределением для нагрузочных тестов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=0,
+                            help='Сколько синтетических ингредиентов '
+                                 'добавить к уже загруженным')
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def pick(self, population, cum_weights, count=1):
+        return self.random.choices(
+            population, cum_weights=cum_weights, k=count
+        )
+
+    def create_users(self, count, prefix):
+        password = make_password('bench-password')
+        User.objects.bulk_create((
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password
+            ) for number in range(count)
+        ), batch_size=self.batch_size, ignore_conflicts=True)
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('id', flat=True))
+
+    def create_tags(self, count, prefix):
+        Tag.objects.bulk_create((
+            Tag(
+                name=f'{prefix} тег {number}',
+                slug=f'{prefix}-{number}',
+                color=COLORS[number % len(COLORS)]
+            ) for number in range(count)
+        ), ignore_conflicts=True)
+        return list(Tag.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).values_list('id', flat=True))
+
+    def create_ingredients(self, count, prefix):
+        Ingredient.objects.bulk_create((
+            Ingredient(name=f'{prefix} ингредиент {number}',
+                       measurement_unit='г')
+            for number in range(count)
+        ), batch_size=self.batch_size)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_recipes(self, count, prefix, users, tags, ingredients):
+        user_weights = zipf_weights(len(users))
+        ingredient_weights = zipf_weights(len(ingredients))
+        tag_weights = zipf_weights(len(tags))
+        Recipe.objects.bulk_create((
+            Recipe(
+                author_id=self.pick(users, user_weights)[0],
+                name=f'{prefix} рецепт {number}',
+                text='Описание рецепта',
+                image='recipes/images/placeholder.png',
+                cooking_time=self.random.randint(5, 180)
+            ) for number in range(count)
+        ), batch_size=self.batch_size)
+        recipes = list(Recipe.objects.filter(
+            name__startswith=f'{prefix} рецепт '
+        ).values_list('id', flat=True))
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(
+                recipe_id=recipe, ingredient_id=ingredient,
+                amount=self.random.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in set(self.pick(
+                ingredients, ingredient_weights, self.random.randint(3, 12)
+            ))
+        ), batch_size=self.batch_size, ignore_conflicts=True)
+        RecipeTag.objects.bulk_create((
+            RecipeTag(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in set(self.pick(tags, tag_weights,
+                                     self.random.randint(1, 3)))
+        ), batch_size=self.batch_size, ignore_conflicts=True)
+        return recipes
+
+    def create_pairs(self, model, count, users, targets, target_field):
+        user_weights = zipf_weights(len(users))
+        target_weights = zipf_weights(len(targets))
+        pairs = set()
+        for _ in range(count):
+            user = self.pick(users, user_weights)[0]
+            target = self.pick(targets, target_weights)[0]
+            if user != target or model is not Subscriptions:
+                pairs.add((user, target))
+        model.objects.bulk_create((
+            model(user_id=user, **{f'{target_field}_id': target})
+            for user, target in pairs
+        ), batch_size=self.batch_size, ignore_conflicts=True)
+
+    def handle(self, prefix, **options):
+        self.random = Random(options['seed'])
+        self.batch_size = options['batch_size']
+        users = self.create_users(options['users'], prefix)
+        tags = self.create_tags(options['tags'], prefix)
+        ingredients = self.create_ingredients(options['ingredients'], prefix)
+        if not ingredients:
+            self.stderr.write('Нет ингредиентов: сначала выполните '
+                              'load_ingridients или передайте --ingredients')
+            return
+        recipes = self.create_recipes(
+            options['recipes'], prefix, users, tags, ingredients
+        )
+        self.random.shuffle(recipes)
+        self.create_pairs(
+            Favorites, options['favorites'], users, recipes, 'recipe'
+        )
+        self.create_pairs(
+            ShoppingCart, options['carts'], users, recipes, 'recipe'
+        )
+        authors = users[:]
+        self.random.shuffle(authors)
+        self.create_pairs(
+            Subscriptions, options['subscriptions'], users, authors, 'author'
+        )
+        call_command('rebuild_recipe_counters', stdout=self.stdout)
+        for cache in (tag_cache, ingredient_cache, pantry_index.cache,
+                      similarity_index.cache):
+            cache.bump()
+        recipe_search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {len(users)} пользователей, {len(recipes)} рецептов'
+        ))
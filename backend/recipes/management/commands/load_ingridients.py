@@ -1,28 +1,202 @@
 import csv
+import json
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from api.cache import ingredient_cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import Lower
 from recipes.models import Ingredient
 
+COPY_SQL = '''
+CREATE TEMPORARY TABLE ingredient_import (
+    name varchar(200), measurement_unit varchar(200)
+) ON COMMIT DROP;
+'''
+COPY_UPDATE_SQL = '''
+UPDATE {table} AS i
+SET name = t.name, measurement_unit = t.measurement_unit
+FROM (
+    SELECT DISTINCT ON (lower(name), lower(measurement_unit)) *
+    FROM ingredient_import
+) AS t
+WHERE lower(i.name) = lower(t.name)
+  AND lower(i.measurement_unit) = lower(t.measurement_unit)
+  AND (i.name <> t.name OR i.measurement_unit <> t.measurement_unit)
+'''
+COPY_INSERT_SQL = '''
+INSERT INTO {table} (name, measurement_unit)
+SELECT DISTINCT ON (lower(name), lower(measurement_unit))
+       name, measurement_unit
+FROM ingredient_import AS t
+WHERE NOT EXISTS (
+    SELECT 1 FROM {table} AS i
+    WHERE lower(i.name) = lower(t.name)
+      AND lower(i.measurement_unit) = lower(t.measurement_unit)
+)
+'''
+
+
+def normalize(value):
+    return ' '.join(str(value).split())
+
+
+def natural_key(name, measurement_unit):
+    return name.lower(), measurement_unit.lower()
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=','):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON')
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            return
+
+
+class CopyStream:
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += '\t'.join(
+                value.replace('\\', '\\\\') for value in row
+            ) + '\n'
+        if size < 0:
+            size = len(self.buffer)
+        try:
+            return self.buffer[:size]
+        finally:
+            self.buffer = self.buffer[size:]
+
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON пачками, '
+            'обновляя уже существующие по названию и единице измерения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='./data/ingredients.csv'
+        )
+        parser.add_argument('--format', choices=('csv', 'json'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузка через COPY (только PostgreSQL)'
+        )
+
+    def read_rows(self, file, file_format):
+        reader = read_json if file_format == 'json' else read_csv
+        for name, measurement_unit in reader(file):
+            name, measurement_unit = (
+                normalize(name), normalize(measurement_unit)
+            )
+            if name and measurement_unit:
+                yield name, measurement_unit
+
+    def load_batch(self, batch, counts):
+        rows = {}
+        for name, measurement_unit in batch:
+            rows.setdefault(natural_key(name, measurement_unit),
+                            (name, measurement_unit))
+        counts['skipped'] += len(batch) - len(rows)
+        existing = Ingredient.objects.annotate(
+            lower_name=Lower('name'),
+            lower_unit=Lower('measurement_unit')
+        ).filter(
+            lower_name__in={key[0] for key in rows},
+            lower_unit__in={key[1] for key in rows}
+        )
+        changed = []
+        for ingredient in existing:
+            key = natural_key(ingredient.name, ingredient.measurement_unit)
+            if key not in rows:
+                continue
+            name, measurement_unit = rows.pop(key)
+            if (ingredient.name, ingredient.measurement_unit) == (
+                name, measurement_unit
+            ):
+                counts['skipped'] += 1
+                continue
+            ingredient.name = name
+            ingredient.measurement_unit = measurement_unit
+            changed.append(ingredient)
+        Ingredient.objects.bulk_update(
+            changed, ('name', 'measurement_unit')
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in rows.values()
+        )
+        counts['updated'] += len(changed)
+        counts['inserted'] += len(rows)
+
+    def load_copy(self, rows, counts):
+        if connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только в PostgreSQL')
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(COPY_SQL)
+            cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN', CopyStream(rows)
+            )
+            cursor.execute('SELECT count(*) FROM ingredient_import')
+            total = cursor.fetchone()[0]
+            cursor.execute(COPY_UPDATE_SQL.format(table=table))
+            counts['updated'] = cursor.rowcount
+            cursor.execute(COPY_INSERT_SQL.format(table=table))
+            counts['inserted'] = cursor.rowcount
+        counts['skipped'] = total - counts['updated'] - counts['inserted']
 
-    def handle(self, **kwargs):
-        file_path = './data/ingredients.csv'
-        with open(
-            file_path,
-            'r',
-            encoding='UTF-8'
-        ) as file:
-            reader = csv.reader(file, delimiter=',')
-
-            ingredient_list = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
-                for row in reader
-            ]
-        Ingredient.objects.bulk_create(ingredient_list)
+    def handle(self, path, batch_size, copy, **kwargs):
+        path = Path(path)
+        file_format = kwargs['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Поддерживаются только CSV и JSON')
+        counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        with open(path, 'r', encoding='UTF-8') as file:
+            rows = self.read_rows(file, file_format)
+            if copy:
+                self.load_copy(rows, counts)
+            else:
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    with transaction.atomic():
+                        self.load_batch(batch, counts)
+        ingredient_cache.bump()
         self.stdout.write(self.style.SUCCESS(
-                          'Ингредиенты загружены'
-                          ))
+            'Ингредиенты загружены: добавлено {inserted}, '
+            'обновлено {updated}, пропущено {skipped}'.format(**counts)
+        ))
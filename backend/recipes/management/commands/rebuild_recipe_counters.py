@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorites, Recipe, ShoppingCart
+
+
+def count_for(model):
+    counts = model.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного и корзин у рецептов'
+
+    def handle(self, **kwargs):
+        updated = Recipe.objects.update(
+            favorites_count=count_for(Favorites),
+            in_carts_count=count_for(ShoppingCart)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны у {updated} рецептов'
+        ))
@@ -0,0 +1,10 @@
+from api.search import recipe_search
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс рецептов'
+
+    def handle(self, **kwargs):
+        recipe_search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
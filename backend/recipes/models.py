@@ -1,7 +1,11 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Lower
+
+from .storage import HashedFileSystemStorage
 
 User = get_user_model()
 
@@ -45,6 +49,12 @@ class Ingredient(models.Model):
         ordering = ['-id']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(
+                Lower('name'), Lower('measurement_unit'),
+                name='ingredient_natural_key_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -60,8 +70,13 @@ class Recipe(models.Model):
         'Наименование рецепта', max_length=200
     )
     image = models.ImageField(verbose_name='Картинка',
-                              upload_to='recipes/images'
+                              upload_to='recipes/images',
+                              storage=HashedFileSystemStorage()
                               )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии картинки', default=dict,
+        editable=False
+    )
     text = models.TextField(
         verbose_name='Описание рецепта', max_length=200
     )
@@ -79,11 +94,28 @@ class Recipe(models.Model):
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления', validators=(MinValueValidator(1),)
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в корзину', default=0, editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_feed_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
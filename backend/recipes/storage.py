@@ -0,0 +1,36 @@
+from hashlib import sha256
+from os import utime
+from os.path import dirname, join, splitext
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """Файлы с именем по sha256 содержимого.
+
+    Одинаковые файлы хранятся один раз: если файл с таким хешем уже
+    есть, запись пропускается, а время изменения обновляется, чтобы
+    collect_images не удалил его как давно забытый. Имена неизменяемы,
+    поэтому их можно кэшировать навсегда.
+    """
+
+    def hashed_name(self, name, content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        extension = splitext(name)[1].lower()
+        return join(dirname(name), hexdigest[:2], hexdigest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name